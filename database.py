@@ -4,20 +4,44 @@
 
 import sqlite3
 import json
+import threading
 from datetime import datetime
 from contextlib import contextmanager
+from typing import Optional
 
 DB_PATH = "iran_bot.db"
 
+# חיבור יחיד לכל התהליך, נפתח בשימוש הראשון
+_conn = None
+_lock = threading.Lock()
+
+# מראה בזיכרון של הכתבות האחרונות שנשלחו – בדיקה בלי לגשת לדיסק
+SENT_CACHE_SIZE = 10000
+_sent_urls: set[str] = set()
+
+_fts_available = False
+
+
+def _open_conn() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+    PRAGMA journal_mode=WAL;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-64000;
+    """)
+    return conn
+
+
 @contextmanager
 def get_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-        conn.commit()
-    finally:
-        conn.close()
+    """גישה בלעדית לחיבור המשותף (autocommit)"""
+    global _conn
+    with _lock:
+        if _conn is None:
+            _conn = _open_conn()
+        yield _conn
 
 
 def init_db():
@@ -52,10 +76,31 @@ def init_db():
             sent_to     INTEGER,
             sent_at     TEXT DEFAULT CURRENT_TIMESTAMP
         );
+
+        CREATE INDEX IF NOT EXISTS idx_search_history_user
+            ON search_history (user_id, searched_at);
         """)
+        _load_sent_urls(conn)
+        _init_articles_fts(conn)
     print("✅ מסד נתונים אותחל")
 
 
+def _init_articles_fts(conn: sqlite3.Connection):
+    """אינדקס חיפוש לכתבות שב-cache; זמני, נבנה מחדש בכל רענון.
+    דורש FTS5 עם trigram (SQLite 3.34+) – בלעדיו החיפוש נשאר בפייתון"""
+    global _fts_available
+    try:
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS temp.articles_fts USING fts5(
+                text, position UNINDEXED, generation UNINDEXED, tokenize='trigram'
+            )
+        """)
+        _fts_available = True
+    except sqlite3.OperationalError as e:
+        _fts_available = False
+        print(f"⚠️ FTS5 לא זמין, חיפוש ללא אינדקס: {e}")
+
+
 # ── מנויים ──────────────────────────────────────────
 
 def add_subscriber(user_id: int, username: str = ""):
@@ -104,9 +149,29 @@ def count_subscribers() -> int:
 
 # ── כתבות שנשלחו ────────────────────────────────────
 
+def _load_sent_urls(conn: sqlite3.Connection):
+    rows = conn.execute(
+        "SELECT url FROM sent_articles ORDER BY sent_at DESC LIMIT ?",
+        (SENT_CACHE_SIZE,)
+    ).fetchall()
+    _sent_urls.clear()
+    _sent_urls.update(r["url"] for r in rows)
+
+
+def _remember_sent(conn: sqlite3.Connection, urls):
+    _sent_urls.update(urls)
+    # גיזום רק אחרי מרווח של גודל מלא – לא טעינה מחדש בכל כתיבה
+    if len(_sent_urls) > 2 * SENT_CACHE_SIZE:
+        _load_sent_urls(conn)
+
+
 def was_sent(url: str) -> bool:
+    if url in _sent_urls:
+        return True
     with get_conn() as conn:
         row = conn.execute("SELECT 1 FROM sent_articles WHERE url=?", (url,)).fetchone()
+        if row is not None:
+            _remember_sent(conn, (url,))
         return row is not None
 
 
@@ -116,6 +181,32 @@ def mark_sent(url: str, title: str):
             "INSERT OR IGNORE INTO sent_articles (url, title) VALUES (?, ?)",
             (url, title)
         )
+        _remember_sent(conn, (url,))
+
+
+def filter_unsent(urls: list[str]) -> set[str]:
+    """מתוך רשימת כתבות – אלו שעוד לא נשלחו (שאילתה אחת)"""
+    unknown = [u for u in urls if u not in _sent_urls]
+    if not unknown:
+        return set()
+    with get_conn() as conn:
+        rows = conn.execute(
+            "SELECT url FROM sent_articles WHERE url IN (%s)" % ",".join("?" * len(unknown)),
+            unknown
+        ).fetchall()
+        found = {r["url"] for r in rows}
+        _remember_sent(conn, found)
+    return set(unknown) - found
+
+
+def mark_sent_bulk(pairs: list[tuple[str, str]]):
+    """סימון כמה כתבות כנשלחו – pairs הם (url, title)"""
+    with get_conn() as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO sent_articles (url, title) VALUES (?, ?)",
+            pairs
+        )
+        _remember_sent(conn, (url for url, _ in pairs))
 
 
 def cleanup_old_articles(days: int = 7):
@@ -125,6 +216,44 @@ def cleanup_old_articles(days: int = 7):
             DELETE FROM sent_articles
             WHERE sent_at < datetime('now', ?)
         """, (f"-{days} days",))
+        _load_sent_urls(conn)
+
+
+# ── חיפוש כתבות ─────────────────────────────────────
+
+def index_articles(articles: list[dict], generation: int, keep: int):
+    """הוספת הכתבות של רענון חדש לאינדקס החיפוש.
+    נשמרות רק השורות של generation ושל keep (הדור שמוגש כרגע)"""
+    if not _fts_available:
+        return
+    with get_conn() as conn:
+        conn.execute("BEGIN")
+        try:
+            conn.execute("DELETE FROM articles_fts WHERE generation != ?", (keep,))
+            conn.executemany(
+                "INSERT INTO articles_fts (text, position, generation) VALUES (?, ?, ?)",
+                [(f"{a.get('title') or ''} {a.get('description') or ''}", i, generation)
+                 for i, a in enumerate(articles)]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def search_articles(query: str, generation: int) -> Optional[list[int]]:
+    """מיקומי הכתבות (ברשימה של אותו דור) שמכילות את הביטוי – לפי הסדר.
+    לפחות 3 תווים (trigram).
+    None כשאין אינדקס – המחפש סורק בעצמו"""
+    if not _fts_available:
+        return None
+    phrase = '"' + query.replace('"', '""') + '"'
+    with get_conn() as conn:
+        rows = conn.execute(
+            "SELECT position FROM articles_fts WHERE articles_fts MATCH ? AND generation = ?",
+            (phrase, generation)
+        ).fetchall()
+        return sorted(r["position"] for r in rows)
 
 
 # ── היסטוריית חיפושים ───────────────────────────────
@@ -5,11 +5,18 @@
 
 import asyncio
 import httpx
-import feedparser
+import io
 import re
+from functools import lru_cache
+from lxml import etree, html as lxhtml
 from datetime import datetime, timezone
 from typing import Optional
 
+try:
+    import ahocorasick
+except ImportError:  # בלי pyahocorasick – סריקה רגילה לפי מילות מפתח
+    ahocorasick = None
+
 # ── מקורות RSS ישראליים ─────────────────────────────
 
 RSS_SOURCES = [
@@ -22,6 +29,9 @@ RSS_SOURCES = [
     {"name": "Reuters MidEast", "url": "https://feeds.reuters.com/Reuters/worldNews",            "lang": "en"},
 ]
 
+RSS_DEADLINE = 8       # שניות לכל סבב – פיד איטי לא מעכב את כל הרענון
+RSS_CONCURRENCY = 10   # מקסימום שליפות במקביל
+
 # ── מילות מפתח לפי דחיפות ───────────────────────────
 
 LEVEL_3_KEYWORDS = [  # 🔴 קריטי
@@ -49,26 +59,73 @@ REGION_KEYWORDS = {
     "all":    [],
 }
 
+# מילות המפתח באותיות קטנות – מחושב פעם אחת בטעינה
+_LEVEL_3_LC = tuple(k.lower() for k in LEVEL_3_KEYWORDS)
+_LEVEL_2_LC = tuple(k.lower() for k in LEVEL_2_KEYWORDS)
+_LEVEL_1_LC = tuple(k.lower() for k in LEVEL_1_KEYWORDS)
+_REGION_LC = {r: tuple(k.lower() for k in kws) for r, kws in REGION_KEYWORDS.items()}
+
+
+# סדר העדיפות בין אזורים – הראשון שנמצא ברשימה קובע
+REGION_ORDER = [r for r in REGION_KEYWORDS if r != "all"]
+
+
+def _keyword_table() -> tuple:
+    """טבלה שטוחה אחת לכל מילות המפתח: (מילה, (דחיפות, דירוג אזור))"""
+    no_region = len(REGION_ORDER)
+    payloads = {}
+    for level, keywords in ((3, _LEVEL_3_LC), (2, _LEVEL_2_LC), (1, _LEVEL_1_LC)):
+        for k in keywords:
+            kw_level, kw_rank = payloads.get(k, (0, no_region))
+            payloads[k] = (max(kw_level, level), kw_rank)
+    for rank, region in enumerate(REGION_ORDER):
+        for k in _REGION_LC[region]:
+            kw_level, kw_rank = payloads.get(k, (0, no_region))
+            payloads[k] = (kw_level, min(kw_rank, rank))
+    return tuple(payloads.items())
+
+
+KEYWORD_TABLE = _keyword_table()
+
+
+def _build_automaton():
+    """אוטומט Aho-Corasick אחד לכל הטבלה"""
+    automaton = ahocorasick.Automaton()
+    for kw, payload in KEYWORD_TABLE:
+        automaton.add_word(kw, payload)
+    automaton.make_automaton()
+    return automaton
+
+
+AUTOMATON = _build_automaton() if ahocorasick else None
+
+
+def _matches(text_lower: str):
+    """התאמות (דחיפות, דירוג אזור) – דרך האוטומט, או חיפוש ישיר בלעדיו"""
+    if AUTOMATON is not None:
+        return (payload for _, payload in AUTOMATON.iter(text_lower))
+    return (payload for kw, payload in KEYWORD_TABLE if kw in text_lower)
+
+
+@lru_cache(maxsize=1024)
+def classify(text: str) -> tuple[int, str]:
+    """דחיפות ואזור במעבר יחיד על הטקסט (הפיד חוזר על אותן כתבות בכל רענון)"""
+    level, rank = 0, len(REGION_ORDER)
+    for kw_level, kw_rank in _matches(text.lower()):
+        if kw_level > level:
+            level = kw_level
+        if kw_rank < rank:
+            rank = kw_rank
+    region = REGION_ORDER[rank] if rank < len(REGION_ORDER) else "all"
+    return level, region
+
 
 def detect_level(text: str) -> int:
-    text_lower = text.lower()
-    if any(k.lower() in text_lower for k in LEVEL_3_KEYWORDS):
-        return 3
-    if any(k.lower() in text_lower for k in LEVEL_2_KEYWORDS):
-        return 2
-    if any(k.lower() in text_lower for k in LEVEL_1_KEYWORDS):
-        return 1
-    return 0
+    return classify(text)[0]
 
 
 def detect_region(text: str) -> str:
-    text_lower = text.lower()
-    for region, keywords in REGION_KEYWORDS.items():
-        if region == "all":
-            continue
-        if any(k.lower() in text_lower for k in keywords):
-            return region
-    return "all"
+    return classify(text)[1]
 
 
 def level_emoji(level: int) -> str:
@@ -79,46 +136,125 @@ def level_label(level: int) -> str:
     return {3: "קריטי", 2: "דחוף", 1: "רגיל", 0: "כללי"}.get(level, "כללי")
 
 
-# ── שליפת RSS ────────────────────────────────────────
+_HTML_RE = re.compile(r"<[^>]+>")
+
 
-async def fetch_rss(source: dict) -> list[dict]:
+def strip_html(desc: str) -> str:
+    """טקסט נקי מתיאור HTML (כולל פענוח ישויות)"""
+    if not desc:
+        return ""
     try:
-        async with httpx.AsyncClient(timeout=10, follow_redirects=True) as client:
-            r = await client.get(source["url"])
-            feed = feedparser.parse(r.text)
-            articles = []
-            for entry in feed.entries[:10]:
-                title = entry.get("title", "")
-                desc = entry.get("summary", entry.get("description", ""))
-                url = entry.get("link", "")
-                published = entry.get("published", "")
-
-                combined = f"{title} {desc}"
-                level = detect_level(combined)
-                if level == 0:
-                    continue  # לא רלוונטי
-
-                articles.append({
-                    "title": title,
-                    "description": re.sub(r"<[^>]+>", "", desc)[:200],
-                    "url": url,
-                    "source": source["name"],
-                    "lang": source["lang"],
-                    "level": level,
-                    "region": detect_region(combined),
-                    "published": published,
+        return lxhtml.fragment_fromstring(desc, create_parent=True).text_content()
+    except (etree.ParserError, ValueError):
+        return _HTML_RE.sub("", desc)
+
+
+# ── פענוח פיד ────────────────────────────────────────
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+RSS1 = "{http://purl.org/rss/1.0/}"   # RSS 1.0 / RDF
+DC = "{http://purl.org/dc/elements/1.1/}"
+
+
+def _atom_link(entry) -> str:
+    for link in entry.iterfind(f"{ATOM}link"):
+        if link.get("rel", "alternate") == "alternate":
+            return link.get("href", "")
+    return ""
+
+
+def parse_feed(content: bytes, limit: int = 10) -> list[dict]:
+    """הפריטים הראשונים של פיד RSS 2.0/RSS 1.0/Atom – בלי לבנות את כל העץ"""
+    entries = []
+    events = etree.iterparse(io.BytesIO(content), tag=("item", f"{RSS1}item", f"{ATOM}entry"), recover=True)
+    try:
+        for _, el in events:
+            if el.tag != f"{ATOM}entry":
+                ns = RSS1 if el.tag == f"{RSS1}item" else ""
+                entries.append({
+                    "title": (el.findtext(f"{ns}title") or "").strip(),
+                    "summary": el.findtext(f"{ns}description") or "",
+                    "link": (el.findtext(f"{ns}link") or "").strip(),
+                    "published": el.findtext("pubDate") or el.findtext(f"{DC}date") or "",
+                })
+            else:
+                entries.append({
+                    "title": (el.findtext(f"{ATOM}title") or "").strip(),
+                    "summary": el.findtext(f"{ATOM}summary") or el.findtext(f"{ATOM}content") or "",
+                    "link": _atom_link(el),
+                    "published": el.findtext(f"{ATOM}published") or el.findtext(f"{ATOM}updated") or "",
                 })
-            return articles
+            el.clear()
+            if len(entries) == limit:
+                break
+    except etree.XMLSyntaxError:
+        pass  # מחזירים את מה שהספקנו לקרוא
+    return entries
+
+
+# ── HTTP ─────────────────────────────────────────────
+
+def new_client() -> httpx.AsyncClient:
+    """לקוח HTTP משותף לכל השליפות – חיבורים נשמרים בין בקשות"""
+    return httpx.AsyncClient(
+        timeout=10,
+        follow_redirects=True,
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+    )
+
+
+# ── שליפת RSS ────────────────────────────────────────
+
+async def fetch_rss(client: httpx.AsyncClient, source: dict) -> list[dict]:
+    try:
+        r = await client.get(source["url"])
+        entries = await asyncio.to_thread(parse_feed, r.content)
+        articles = []
+        for entry in entries:
+            title = entry["title"]
+            desc = entry["summary"]
+            url = entry["link"]
+            published = entry["published"]
+
+            combined = f"{title} {desc}"
+            level, region = classify(combined)
+            if level == 0:
+                continue  # לא רלוונטי
+
+            articles.append({
+                "title": title,
+                "description": strip_html(desc)[:200],
+                "url": url,
+                "source": source["name"],
+                "lang": source["lang"],
+                "level": level,
+                "region": region,
+                "published": published,
+            })
+        return articles
     except Exception as e:
         return []
 
 
-async def fetch_all_rss() -> list[dict]:
-    tasks = [fetch_rss(src) for src in RSS_SOURCES]
-    results = await asyncio.gather(*tasks)
+async def fetch_all_rss(client: httpx.AsyncClient) -> list[dict]:
+    sem = asyncio.Semaphore(RSS_CONCURRENCY)
+
+    async def bounded(src: dict) -> list[dict]:
+        async with sem:
+            return await fetch_rss(client, src)
+
+    tasks = [asyncio.create_task(bounded(src)) for src in RSS_SOURCES]
+    done, pending = await asyncio.wait(tasks, timeout=RSS_DEADLINE)
+    for task in pending:
+        task.cancel()  # מקורות שלא הספיקו – נוותר עליהם בסבב הזה
+    if pending:
+        await asyncio.wait(pending)
+
     articles = []
-    for result in results:
-        articles.extend(result)
+    for task in tasks:
+        if task in done and not task.exception():
+            articles.extend(task.result())
     # מיון לפי דחיפות
     articles.sort(key=lambda x: x["level"], reverse=True)
     return articles
@@ -126,7 +262,7 @@ async def fetch_all_rss() -> list[dict]:
 
 # ── NewsAPI ──────────────────────────────────────────
 
-async def fetch_newsapi(query: str, api_key: str, lang: str = "en", page_size: int = 5) -> list[dict]:
+async def fetch_newsapi(client: httpx.AsyncClient, query: str, api_key: str, lang: str = "en", page_size: int = 5) -> list[dict]:
     if not api_key or api_key == "YOUR_NEWS_KEY":
         return []
     url = "https://newsapi.org/v2/everything"
@@ -136,24 +272,23 @@ async def fetch_newsapi(query: str, api_key: str, lang: str = "en", page_size: i
         "apiKey": api_key,
     }
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            r = await client.get(url, params=params)
-            data = r.json()
-            articles = []
-            for a in data.get("articles", []):
-                combined = f"{a.get('title','')} {a.get('description','')}"
-                level = detect_level(combined)
-                articles.append({
-                    "title": a.get("title", ""),
-                    "description": (a.get("description") or "")[:200],
-                    "url": a.get("url", ""),
-                    "source": a.get("source", {}).get("name", ""),
-                    "lang": lang,
-                    "level": level,
-                    "region": detect_region(combined),
-                    "published": a.get("publishedAt", ""),
-                })
-            return articles
+        r = await client.get(url, params=params)
+        data = r.json()
+        articles = []
+        for a in data.get("articles", []):
+            combined = f"{a.get('title') or ''} {a.get('description') or ''}"
+            level, region = classify(combined)
+            articles.append({
+                "title": a.get("title") or "",
+                "description": (a.get("description") or "")[:200],
+                "url": a.get("url") or "",
+                "source": a.get("source", {}).get("name", ""),
+                "lang": lang,
+                "level": level,
+                "region": region,
+                "published": a.get("publishedAt", ""),
+            })
+        return articles
     except Exception:
         return []
 
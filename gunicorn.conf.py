@@ -0,0 +1,18 @@
+"""
+הגדרות gunicorn לפרודקשן
+worker יחיד עם threads – ה-cache והרענון ברקע חיים בזיכרון של התהליך,
+כך שכל worker נוסף היה שולף את כל המקורות מחדש בנפרד
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = "gthread"
+workers = 1
+threads = int(os.getenv("WEB_THREADS", "8"))
+timeout = 120
+
+
+def post_worker_init(worker):
+    from server import bootstrap
+    bootstrap()
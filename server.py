@@ -5,75 +5,169 @@ War Monitor – Flask Backend API
 
 import os
 import asyncio
+import atexit
+import hashlib
+import heapq
 import time
+from functools import wraps
 from threading import Thread
-from flask import Flask, jsonify, send_from_directory, request
+import orjson
+from flask import Flask, Response, jsonify, make_response, send_from_directory, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 
-from database import init_db, was_sent, mark_sent, cleanup_old_articles
-from fetcher import fetch_all_rss, fetch_newsapi, detect_level, detect_region
+from database import init_db, was_sent, mark_sent, cleanup_old_articles, index_articles, search_articles
+from fetcher import fetch_all_rss, fetch_newsapi, new_client, detect_level, detect_region
 
 # ── הגדרות ──────────────────────────────────────────
 NEWS_API_KEY = os.getenv("NEWS_API_KEY", "")
 REFRESH_INTERVAL = int(os.getenv("REFRESH_INTERVAL", "300"))  # שניות
+NEWS_LIMIT = 30  # ברירת מחדל ל-?limit
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """jsonify דרך orjson במקום json של הספרייה הסטנדרטית"""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 
 app = Flask(__name__, static_folder="static")
+app.json = ORJSONProvider(app)
 CORS(app)
 
 # ── Cache ────────────────────────────────────────────
+
+def build_index(articles: list[dict], generation: int = 0) -> dict:
+    """אינדקסים לסינון – נבנים פעם אחת בכל רענון במקום בכל בקשה"""
+    index = {"articles": articles, "generation": generation,
+             "level": {}, "lang": {}, "region": {}, "text": []}
+    for i, a in enumerate(articles):
+        index["level"].setdefault(a.get("level"), set()).add(i)
+        index["lang"].setdefault(a.get("lang"), set()).add(i)
+        index["region"].setdefault(a.get("region"), set()).add(i)
+        index["text"].append(f"{a.get('title') or ''} {a.get('description') or ''}".lower())
+    return index
+
+
 cache = {
     "articles": [],
+    "index": build_index([]),
     "last_fetch": 0,
-    "stats": {"critical": 0, "urgent": 0, "regular": 0, "total": 0}
+    "stats": {"critical": 0, "urgent": 0, "regular": 0, "total": 0},
+    "news_json": (0, None),
 }
 
 
-def run_async(coro):
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    result = loop.run_until_complete(coro)
-    loop.close()
-    return result
+def update_cache(articles: list[dict]):
+    last_fetch = time.time()
+    stats = {
+        "critical": sum(1 for a in articles if a.get("level") == 3),
+        "urgent":   sum(1 for a in articles if a.get("level") == 2),
+        "regular":  sum(1 for a in articles if a.get("level") == 1),
+        "total":    len(articles)
+    }
+    # תשובת /api/news בלי פילטרים – מקודדת פעם אחת בכל רענון
+    news_json = orjson.dumps({
+        "articles": articles[:NEWS_LIMIT],
+        "count": len(articles),
+        "cached_at": last_fetch,
+        "stats": stats
+    })
+    # השורות של הדור הקודם נשארות באינדקס החיפוש עד הרענון הבא,
+    # כך שבקשה שמחזיקה את ה-snapshot הקודם עדיין מוצאת את הכתבות שלו
+    current = cache["index"]["generation"]
+    index_articles(articles, generation=current + 1, keep=current)
+    cache.update({
+        "articles": articles,
+        "index": build_index(articles, current + 1),
+        "last_fetch": last_fetch,
+        "stats": stats,
+        "news_json": (len(articles), news_json),
+    })
+
+
+# לולאת asyncio אחת ברקע לכל חיי התהליך – לקוח ה-HTTP וחיבוריו נשמרים בין רענונים
+loop = asyncio.new_event_loop()
+http_client = new_client()
+
+
+def run_async(coro, timeout: float = None):
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+
+def start_loop():
+    Thread(target=loop.run_forever, daemon=True).start()
+    atexit.register(lambda: run_async(http_client.aclose(), timeout=5))
 
 
 async def fetch_fresh():
     """שלוף חדשות טריות מכל המקורות"""
-    articles = await fetch_all_rss()
+    articles = await fetch_all_rss(http_client)
     if NEWS_API_KEY:
-        api_en = await fetch_newsapi("Iran Israel attack war military", NEWS_API_KEY, "en", 8)
-        api_he = await fetch_newsapi("איראן ישראל מלחמה צבא", NEWS_API_KEY, "he", 5)
+        api_en = await fetch_newsapi(http_client, "Iran Israel attack war military", NEWS_API_KEY, "en", 8)
+        api_he = await fetch_newsapi(http_client, "איראן ישראל מלחמה צבא", NEWS_API_KEY, "he", 5)
         articles += api_en + api_he
 
-    # מיין לפי דחיפות
-    articles.sort(key=lambda x: x.get("level", 0), reverse=True)
-
-    # הגבל ל-50
-    return articles[:50]
+    # כתבה שמופיעה בכמה מקורות – נשארת פעם אחת, בדחיפות הגבוהה
+    # (כתבות בלי קישור אי אפשר לזהות – כולן נשמרות)
+    unique = []
+    by_url = {}
+    for a in articles:
+        if not a["url"]:
+            unique.append(a)
+            continue
+        pos = by_url.get(a["url"])
+        if pos is None:
+            by_url[a["url"]] = len(unique)
+            unique.append(a)
+        elif a.get("level", 0) > unique[pos].get("level", 0):
+            unique[pos] = a
+
+    # 50 הדחופות ביותר
+    return heapq.nlargest(50, unique, key=lambda x: x.get("level", 0))
 
 
 def refresh_cache():
-    """רענן cache ברקע"""
+    """רענן cache ברקע (הטעינה הראשונה נעשית ב-bootstrap)"""
     while True:
+        time.sleep(REFRESH_INTERVAL)
         try:
             articles = run_async(fetch_fresh())
-            stats = {
-                "critical": sum(1 for a in articles if a.get("level") == 3),
-                "urgent":   sum(1 for a in articles if a.get("level") == 2),
-                "regular":  sum(1 for a in articles if a.get("level") == 1),
-                "total":    len(articles)
-            }
-            cache["articles"] = articles
-            cache["stats"] = stats
-            cache["last_fetch"] = time.time()
+            update_cache(articles)
             print(f"✅ Cache refreshed: {len(articles)} articles")
         except Exception as e:
             print(f"❌ Cache refresh error: {e}")
-        time.sleep(REFRESH_INTERVAL)
 
 
 # ── API Routes ───────────────────────────────────────
 
+def conditional(view):
+    """ETag לפי רענון ה-cache והשאילתה – בקשה חוזרת מקבלת 304 בלי גוף"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = f"{cache['last_fetch']}:{request.full_path}".encode()
+        etag = hashlib.blake2b(key, digest_size=16).hexdigest()
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+        response.set_etag(etag)
+        # עד הרענון הבא התשובה לא משתנה
+        response.cache_control.max_age = max(0, int(cache["last_fetch"] + REFRESH_INTERVAL - time.time()))
+        return response
+    return wrapper
+
+
+def _lookup(table: dict, keys: list) -> set[int]:
+    return set().union(*(table.get(k, ()) for k in keys))
+
+
 @app.route("/api/news")
+@conditional
 def get_news():
     """
     GET /api/news
@@ -83,30 +177,36 @@ def get_news():
     ?q=...          – חיפוש חופשי
     ?limit=20       – הגבלת תוצאות
     """
-    articles = list(cache["articles"])
+    index = cache["index"]
 
     # פילטרים
     level_filter = request.args.get("level")
     lang_filter  = request.args.get("lang")
     region_filter = request.args.get("region")
     query        = request.args.get("q", "").strip().lower()
-    limit        = int(request.args.get("limit", 30))
+    limit        = int(request.args.get("limit", NEWS_LIMIT))
+
+    total, news_json = cache["news_json"]
+    if news_json is not None and not (level_filter or lang_filter or region_filter or query) \
+            and min(limit, total) == min(NEWS_LIMIT, total):
+        return Response(news_json, mimetype="application/json")
+
+    matches = set(range(len(index["articles"])))
 
     if level_filter:
         levels = [int(l) for l in level_filter.split(",")]
-        articles = [a for a in articles if a.get("level") in levels]
+        matches &= _lookup(index["level"], levels)
 
     if lang_filter:
-        articles = [a for a in articles if a.get("lang") == lang_filter]
+        matches &= _lookup(index["lang"], [lang_filter])
 
     if region_filter and region_filter != "all":
-        articles = [a for a in articles if a.get("region") in [region_filter, "all"]]
+        matches &= _lookup(index["region"], [region_filter, "all"])
 
+    hits = sorted(matches)
     if query:
-        articles = [
-            a for a in articles
-            if query in (a.get("title","") + " " + a.get("description","")).lower()
-        ]
+        hits = [i for i in hits if query in index["text"][i]]
+    articles = [index["articles"][i] for i in hits]
 
     return jsonify({
         "articles": articles[:limit],
@@ -117,6 +217,7 @@ def get_news():
 
 
 @app.route("/api/stats")
+@conditional
 def get_stats():
     return jsonify({
         "stats": cache["stats"],
@@ -126,15 +227,18 @@ def get_stats():
 
 
 @app.route("/api/search")
+@conditional
 def search():
     q = request.args.get("q", "").strip().lower()
     if not q:
         return jsonify({"articles": [], "count": 0})
 
-    results = [
-        a for a in cache["articles"]
-        if q in (a.get("title","") + " " + a.get("description","")).lower()
-    ]
+    index = cache["index"]
+    hits = search_articles(q, index["generation"]) if len(q) >= 3 else None  # קצר מדי לאינדקס trigram
+    if hits is not None:
+        results = [index["articles"][i] for i in hits]
+    else:
+        results = [a for a, text in zip(index["articles"], index["text"]) if q in text]
     return jsonify({"articles": results, "count": len(results), "query": q})
 
 
@@ -162,20 +266,16 @@ def static_files(path):
 
 # ── Startup ──────────────────────────────────────────
 
-def start():
+def bootstrap():
+    """אתחול מסד, טעינת cache ראשונית והפעלת רענון ברקע.
+    נקרא מ-start() בהרצה ישירה, ומ-gunicorn.conf.py בכל worker."""
     init_db()
+    start_loop()
 
     # טען cache ראשוני
     try:
         articles = run_async(fetch_fresh())
-        cache["articles"] = articles
-        cache["last_fetch"] = time.time()
-        cache["stats"] = {
-            "critical": sum(1 for a in articles if a.get("level") == 3),
-            "urgent":   sum(1 for a in articles if a.get("level") == 2),
-            "regular":  sum(1 for a in articles if a.get("level") == 1),
-            "total":    len(articles)
-        }
+        update_cache(articles)
         print(f"✅ Initial fetch: {len(articles)} articles")
     except Exception as e:
         print(f"⚠️ Initial fetch failed: {e}")
@@ -184,6 +284,11 @@ def start():
     t = Thread(target=refresh_cache, daemon=True)
     t.start()
 
+
+def start():
+    """שרת פיתוח – בפרודקשן רצים דרך gunicorn (ראו Procfile)"""
+    bootstrap()
+
     port = int(os.getenv("PORT", 5000))
     print(f"🌐 Server running on http://localhost:{port}")
     app.run(host="0.0.0.0", port=port, debug=False)